@@ -10,13 +10,13 @@ Features: Basal rate adjustments, I:C ratio changes, professor scenario builder
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.express as px
 import plotly.graph_objects as go
-from plotly.subplots import make_subplots
-from datetime import datetime, timedelta
-import random
-import json
-import copy
+from dataclasses import dataclass
+from types import MappingProxyType
+import hashlib
+import html
+import warnings
+from string import Template
 
 # Set page configuration
 st.set_page_config(
@@ -27,7 +27,7 @@ st.set_page_config(
 )
 
 # Custom CSS for styling
-st.markdown("""
+CUSTOM_CSS = """
 <style>
     .main-header {
         background: linear-gradient(90deg, #4f46e5, #7c3aed);
@@ -98,251 +98,471 @@ st.markdown("""
         margin: 0.5rem 0;
     }
 </style>
-""", unsafe_allow_html=True)
-
-# Initialize session state
-if 'selected_patient' not in st.session_state:
-    st.session_state.selected_patient = None
-if 'current_week' not in st.session_state:
-    st.session_state.current_week = 0
-if 'patient_progress' not in st.session_state:
-    st.session_state.patient_progress = {}
-if 'learning_stats' not in st.session_state:
-    st.session_state.learning_stats = {
-        'patients_completed': 0,
-        'adjustments_made': 0,
-        'successful_outcomes': 0
+"""
+
+MAIN_HEADER_HTML = """
+<div class="main-header">
+    <h1>💉 Enhanced Insulin Pump Therapy Platform</h1>
+    <h3>Interactive Learning with Real-Time Adjustments</h3>
+</div>
+"""
+
+# Patient scenario summary at the top of the learning journey
+SCENARIO_INFO_HTML = Template("""
+<div class="info-box">
+    <strong>Clinical Scenario:</strong> $description<br>
+    <strong>Primary Challenge:</strong> $clinical_notes<br>
+    <strong>Learning Objectives:</strong>
+    <ul>$objectives</ul>
+</div>
+""")
+
+# Heading of the weekly adjustment panel
+ADJUSTMENT_PANEL_HTML = Template("""
+<div class="adjustment-panel">
+    <h3>🎯 Week $week - Interactive Pump Adjustments</h3>
+    <p>Review the glucose patterns above and adjust the pump settings below. Your changes will be reflected in real-time.</p>
+</div>
+""")
+
+# Clinical feedback shown after an adjustment, by Time in Range change
+EXCELLENT_ADJUSTMENT_HTML = Template("""
+<div class="success-outcome">
+<strong>Excellent Adjustment!</strong><br>
+Your changes improved Time in Range by $tir%. 
+This demonstrates good clinical reasoning in pump management.
+</div>
+""")
+GOOD_ADJUSTMENT_HTML = Template("""
+<div class="success-outcome">
+<strong>Good Adjustment!</strong><br>
+Time in Range improved by $tir%. 
+Consider additional fine-tuning for optimal results.
+</div>
+""")
+POOR_ADJUSTMENT_HTML = """
+<div class="warning-outcome">
+<strong>Consider Alternative Approach</strong><br>
+This adjustment may not improve glucose control. 
+Review the patterns and consider different settings.
+</div>
+"""
+
+# Sidebar progress summary, rendered as a single markdown element
+PROGRESS_TABLE_MD = """### 📈 Your Progress
+| Metric | Value |
+|---|---|
+| Patients Completed | {patients_completed} |
+| Adjustments Made | {adjustments_made} |
+| Successful Outcomes | {successful_outcomes} |
+"""
+
+@st.cache_resource
+def inject_css():
+    """Inject the custom CSS; Streamlit replays the cached element on reruns"""
+    st.markdown(CUSTOM_CSS, unsafe_allow_html=True)
+
+inject_css()
+
+# Initialize session state. Defaults are built fresh per run so sessions never share mutable
+# values, and each missing key is filled individually so keys added later still reach
+# sessions that started before them.
+def session_state_defaults():
+    """Return a new dict of default session state values"""
+    return {
+        'selected_patient_id': None,
+        'current_week': 0,
+        'learning_stats': {
+            'patients_completed': 0,
+            'adjustments_made': 0,
+            'successful_outcomes': 0
+        },
+        'current_glucose_data': None,
+        'current_glucose_metrics': None,
+        'adjustment_made': False,
+        'custom_scenarios': [],
+        'custom_scenarios_created': 0,
+        'patient_settings': {},
+        'patient_index': None,
+        'journey_view': None,
+        'journey_message': None,
+        'professor_mode': False
     }
-if 'current_glucose_data' not in st.session_state:
-    st.session_state.current_glucose_data = None
-if 'adjustment_made' not in st.session_state:
-    st.session_state.adjustment_made = False
-if 'custom_scenarios' not in st.session_state:
-    st.session_state.custom_scenarios = []
-if 'professor_mode' not in st.session_state:
-    st.session_state.professor_mode = False
 
-# Enhanced glucose data generation with insulin sensitivity
-def generate_glucose_data(days=7, basal_rates=None, issues=None, ic_ratios=None, correction_factor=50, week=0):
-    """Generate realistic CGM-style glucose data based on pump settings"""
-    np.random.seed(42 + week)  # Vary by week for progression
+for key, value in session_state_defaults().items():
+    st.session_state.setdefault(key, value)
+
+# Meal times and the I:C ratio slot (index into MEAL_NAMES) used for each hour of the day
+MEAL_NAMES = ['breakfast', 'lunch', 'dinner']
+MEAL_HOURS = [7, 12, 18]
+MEAL_INDEX_BY_HOUR = np.array([hour//7 if hour < 14 else (1 if hour < 17 else 2) for hour in range(24)])
+
+# Per-issue glucose adjustments. Each returns the affected samples and the glucose delta
+# for the given week; has_ic_ratios tells whether meal ratios are configured.
+def _dawn_phenomenon_adjustment(hours, week, hypo_draws, has_ic_ratios):
+    return (hours >= 4) & (hours <= 7), max(0, 40 - (week * 10))  # Reduce over time
+
+def _afternoon_lows_adjustment(hours, week, hypo_draws, has_ic_ratios):
+    return (hours >= 14) & (hours <= 16), -max(0, 30 - (week * 7))
+
+def _post_meal_spikes_adjustment(hours, week, hypo_draws, has_ic_ratios):
+    spike_reduction = week * 15 if has_ic_ratios else 0
+    return np.isin(hours, [13, 19]), max(20, 80 - spike_reduction)
+
+def _nocturnal_lows_adjustment(hours, week, hypo_draws, has_ic_ratios):
+    return (hours >= 1) & (hours <= 3), -max(0, 25 - (week * 6))
+
+def _hypoglycemia_unawareness_adjustment(hours, week, hypo_draws, has_ic_ratios):
+    return hypo_draws < 0.05, -40
+
+# Adjustment per clinical issue, in order of precedence
+ISSUE_ADJUSTMENTS = {
+    'dawn_phenomenon': _dawn_phenomenon_adjustment,
+    'afternoon_lows': _afternoon_lows_adjustment,
+    'post_meal_spikes': _post_meal_spikes_adjustment,
+    'nocturnal_lows': _nocturnal_lows_adjustment,
+    'hypoglycemia_unawareness': _hypoglycemia_unawareness_adjustment
+}
+
+def select_issue_adjustments(issues):
+    """Return the adjustment functions that apply to a patient's issues, in order of precedence"""
+    return tuple(adjustment for issue, adjustment in ISSUE_ADJUSTMENTS.items() if issue in issues)
+
+def _glucose_kernel(hours, minutes, basal_arr, noise, hypo_draws, meal_carbs, adjustments, ic_by_hour, correction_factor, week):
+    """Compute glucose values from sample arrays, pre-drawn randomness and a tuple of issue
+    adjustment callables (see ISSUE_ADJUSTMENTS); the kernel itself draws no random numbers"""
+    # Basal rate effect for every sample
+    basal_effect = basal_arr[hours] * 50  # Rough conversion to glucose effect
     
+    # Base glucose pattern based on time of day
+    periods = [
+        (hours >= 6) & (hours <= 8),    # Dawn phenomenon
+        (hours >= 12) & (hours <= 14),  # Post-lunch
+        (hours >= 18) & (hours <= 20),  # Post-dinner
+        (hours >= 2) & (hours <= 4),    # Overnight
+    ]
+    means = np.select(periods, [140, 160, 150, 95], default=120).astype(np.float32)
+    stds = np.select(periods, [15, 20, 18, 10], default=12).astype(np.float32)
+    base_glucose = means + noise * stds - basal_effect
+    
+    # Apply specific issues if present and week < 4 (before major adjustments).
+    # Each sample takes at most one adjustment, the first matching issue.
+    if adjustments and week < 4:
+        unadjusted = np.ones(hours.size, dtype=bool)
+        for adjustment in adjustments:
+            mask, delta = adjustment(hours, week, hypo_draws, ic_by_hour.size > 0)
+            mask = mask & unadjusted
+            base_glucose[mask] += delta
+            unadjusted &= ~mask
+    
+    # Meal bolus effects based on I:C ratios
+    meal_mask = (minutes == 0) & np.isin(hours, MEAL_HOURS)
+    meal_rise = np.full(meal_carbs.shape, 60.0, dtype=np.float32)  # Uncontrolled rise
+    if ic_by_hour.size:
+        ratios = ic_by_hour[hours[meal_mask]]
+        glucose_drop = meal_carbs / ratios * correction_factor
+        meal_rise = np.where(np.isnan(ratios), meal_rise, 80 - glucose_drop)  # Post-meal rise minus insulin effect
+    base_glucose[meal_mask] += meal_rise
+    
+    # Ensure glucose stays in reasonable bounds
+    return np.clip(base_glucose, 40, 400)
+
+# The 5-minute sample grid depends only on the number of days, so it is built once and
+# shared read-only across sessions, weeks and settings
+@st.cache_resource(show_spinner=False)
+def cgm_time_grid(days):
+    """Return (timestamps, hours, minutes) arrays for days of 5-minute CGM samples"""
     timestamps = pd.date_range(start='2024-01-01', periods=days*288, freq='5min')
-    glucose_values = []
+    grid = (timestamps.to_numpy(), timestamps.hour.to_numpy(), timestamps.minute.to_numpy())
+    for values in grid:
+        values.flags.writeable = False
+    return grid
+
+def simulate_week_glucose(hours, minutes, basal_rates=None, issues=(), ic_ratios=None, correction_factor=50, week=0):
+    """Simulate one week of glucose values at the given sample hours/minutes and pump settings"""
+    rng = np.random.default_rng(42 + week)  # Vary by week for progression
+    
+    n_samples = hours.size
     
     # Default basal rates if none provided
     if basal_rates is None:
         basal_rates = [0.8] * 24
     
-    for i, ts in enumerate(timestamps):
-        hour = ts.hour
-        minute = ts.minute
-        
-        # Get current basal rate effect
-        current_basal = basal_rates[hour]
-        basal_effect = current_basal * 50  # Rough conversion to glucose effect
-        
-        # Base glucose pattern based on time of day
-        if 6 <= hour <= 8:  # Dawn phenomenon
-            base_glucose = 140 + np.random.normal(0, 15) - basal_effect
-        elif 12 <= hour <= 14:  # Post-lunch
-            base_glucose = 160 + np.random.normal(0, 20) - basal_effect
-        elif 18 <= hour <= 20:  # Post-dinner
-            base_glucose = 150 + np.random.normal(0, 18) - basal_effect
-        elif 2 <= hour <= 4:  # Overnight
-            base_glucose = 95 + np.random.normal(0, 10) - basal_effect
-        else:
-            base_glucose = 120 + np.random.normal(0, 12) - basal_effect
-        
-        # Apply specific issues if present and week < 4 (before major adjustments)
-        if issues and week < 4:
-            if 'dawn_phenomenon' in issues and 4 <= hour <= 7:
-                base_glucose += max(0, 40 - (week * 10))  # Reduce over time
-            elif 'afternoon_lows' in issues and 14 <= hour <= 16:
-                base_glucose -= max(0, 30 - (week * 7))
-            elif 'post_meal_spikes' in issues and (hour in [13, 19]):
-                spike_reduction = week * 15 if ic_ratios else 0
-                base_glucose += max(20, 80 - spike_reduction)
-            elif 'nocturnal_lows' in issues and 1 <= hour <= 3:
-                base_glucose -= max(0, 25 - (week * 6))
-            elif 'hypoglycemia_unawareness' in issues and np.random.random() < 0.05:
-                base_glucose -= 40
-        
-        # Meal bolus effects based on I:C ratios
-        if minute == 0 and hour in [7, 12, 18]:  # Meal times
-            meal_carbs = np.random.normal(45, 15)  # Average meal carbs
-            if ic_ratios:
-                meal_key = ['breakfast', 'lunch', 'dinner'][hour//7 if hour < 14 else (1 if hour < 17 else 2)]
-                if meal_key in ic_ratios:
-                    insulin_needed = meal_carbs / ic_ratios[meal_key]
-                    glucose_drop = insulin_needed * correction_factor
-                    base_glucose = base_glucose + 80 - glucose_drop  # Post-meal rise minus insulin effect
-                else:
-                    base_glucose += 60  # Uncontrolled rise
-            else:
-                base_glucose += 60
-        
-        # Ensure glucose stays in reasonable bounds
-        base_glucose = max(40, min(400, base_glucose))
-        glucose_values.append(base_glucose)
+    ic_by_hour = ic_hour_lookup(dict(ic_ratios)) if ic_ratios else np.empty(0, dtype=np.float32)
     
-    return pd.DataFrame({
-        'timestamp': timestamps,
-        'glucose': glucose_values
-    })
+    # Draw all randomness up front so the kernel is deterministic given its inputs
+    n_meals = np.count_nonzero((minutes == 0) & np.isin(hours, MEAL_HOURS))
+    noise = rng.standard_normal(n_samples, dtype=np.float32)
+    hypo_draws = rng.random(n_samples, dtype=np.float32)
+    meal_carbs = rng.normal(45, 15, size=n_meals).astype(np.float32)  # Average meal carbs
+    
+    return _glucose_kernel(
+        hours, minutes, np.asarray(basal_rates, dtype=np.float32), noise, hypo_draws, meal_carbs,
+        select_issue_adjustments(issues), ic_by_hour, correction_factor, week
+    )
 
-# Mock patient data with comprehensive pump settings
-PUMP_PATIENTS = [
-    {
-        'id': 'pump-001',
-        'name': 'Sarah Chen',
-        'age': 28,
-        'gender': 'Female',
-        'mrn': 'PT001',
-        'diabetes_type': 'Type 1',
-        'duration_diabetes': '15 years',
-        'pump_type': 'Tandem t:slim X2',
-        'cgm_type': 'Dexcom G6',
-        'algorithm': 'Control-IQ',
-        'original_settings': {
-            'basal_profile': [0.8, 0.6, 0.5, 0.5, 0.9, 1.2, 1.0, 0.8, 0.7, 0.7, 0.8, 0.9, 
-                            1.0, 0.8, 0.7, 0.6, 0.8, 1.1, 1.0, 0.9, 0.8, 0.8, 0.8, 0.8],
-            'ic_ratios': {'breakfast': 12, 'lunch': 15, 'dinner': 10},
-            'correction_factor': 50,
-            'target_glucose': 110
-        },
-        'current_settings': {
-            'basal_profile': [0.8, 0.6, 0.5, 0.5, 0.9, 1.2, 1.0, 0.8, 0.7, 0.7, 0.8, 0.9, 
-                            1.0, 0.8, 0.7, 0.6, 0.8, 1.1, 1.0, 0.9, 0.8, 0.8, 0.8, 0.8],
-            'ic_ratios': {'breakfast': 12, 'lunch': 15, 'dinner': 10},
-            'correction_factor': 50,
-            'target_glucose': 110
-        },
-        'scenario': 'dawn_phenomenon',
-        'description': 'Active professional with consistent dawn phenomenon requiring basal optimization',
-        'clinical_notes': 'Patient reports morning glucose consistently 180-220 mg/dL despite overnight target range. Needs early morning basal adjustment.',
-        'a1c_trend': [7.8, 7.5, 7.2],
-        'learning_objectives': [
-            'Recognize dawn phenomenon pattern in CGM data',
-            'Calculate appropriate basal rate increases for early morning',
-            'Monitor response to basal adjustments over time'
-        ]
-    },
-    {
-        'id': 'pump-002',
-        'name': 'Miguel Rodriguez',
-        'age': 34,
-        'gender': 'Male',
-        'mrn': 'PT002',
-        'diabetes_type': 'Type 1',
-        'duration_diabetes': '8 years',
-        'pump_type': 'Omnipod 5',
-        'cgm_type': 'Dexcom G6',
-        'algorithm': 'SmartAdjust',
-        'original_settings': {
-            'basal_profile': [0.9, 0.8, 0.7, 0.7, 0.8, 0.9, 1.1, 0.9, 0.8, 0.8, 0.9, 1.0,
-                            1.2, 1.0, 0.6, 0.5, 0.8, 1.0, 1.1, 1.0, 0.9, 0.9, 0.9, 0.9],
-            'ic_ratios': {'breakfast': 10, 'lunch': 12, 'dinner': 8},
-            'correction_factor': 45,
-            'target_glucose': 120
-        },
-        'current_settings': {
-            'basal_profile': [0.9, 0.8, 0.7, 0.7, 0.8, 0.9, 1.1, 0.9, 0.8, 0.8, 0.9, 1.0,
-                            1.2, 1.0, 0.6, 0.5, 0.8, 1.0, 1.1, 1.0, 0.9, 0.9, 0.9, 0.9],
-            'ic_ratios': {'breakfast': 10, 'lunch': 12, 'dinner': 8},
-            'correction_factor': 45,
-            'target_glucose': 120
-        },
-        'scenario': 'exercise_management',
-        'description': 'Marathon runner struggling with exercise-induced hypoglycemia',
-        'clinical_notes': 'Patient runs 6 miles daily at 4 PM. Frequent lows during and after exercise despite reducing basal. May need exercise mode optimization.',
-        'a1c_trend': [6.9, 7.1, 7.3],
-        'learning_objectives': [
-            'Identify exercise-related hypoglycemia patterns',
-            'Implement temporary basal reductions for exercise',
-            'Understand delayed post-exercise hypoglycemia risk'
-        ]
-    },
-    {
-        'id': 'pump-003',
-        'name': 'Jennifer Park',
-        'age': 19,
-        'gender': 'Female',
-        'mrn': 'PT003',
-        'diabetes_type': 'Type 1',
-        'duration_diabetes': '3 years',
-        'pump_type': 'Medtronic 780G',
-        'cgm_type': 'Guardian 4',
-        'algorithm': 'SmartGuard',
-        'original_settings': {
-            'basal_profile': [0.6, 0.5, 0.4, 0.4, 0.6, 0.8, 0.9, 0.7, 0.6, 0.7, 0.8, 0.9,
-                            1.1, 1.3, 0.8, 0.7, 0.9, 1.2, 1.0, 0.8, 0.7, 0.6, 0.6, 0.6],
-            'ic_ratios': {'breakfast': 15, 'lunch': 18, 'dinner': 12},
-            'correction_factor': 60,
-            'target_glucose': 100
-        },
-        'current_settings': {
-            'basal_profile': [0.6, 0.5, 0.4, 0.4, 0.6, 0.8, 0.9, 0.7, 0.6, 0.7, 0.8, 0.9,
-                            1.1, 1.3, 0.8, 0.7, 0.9, 1.2, 1.0, 0.8, 0.7, 0.6, 0.6, 0.6],
-            'ic_ratios': {'breakfast': 15, 'lunch': 18, 'dinner': 12},
-            'correction_factor': 60,
-            'target_glucose': 100
+@dataclass(frozen=True)
+class CGMSeries:
+    """A CGM trace: datetime64 timestamps and matching glucose values (mg/dL)"""
+    timestamps: np.ndarray
+    glucose: np.ndarray
+
+# Enhanced glucose data generation with insulin sensitivity.
+# Output is deterministic per week, so results are cached across reruns; issues,
+# basal_rates and ic_ratios are passed as tuples (see settings_cache_args) to keep cache keys cheap.
+@st.cache_data(max_entries=256, show_spinner=False)
+def generate_glucose_data(days=7, basal_rates=None, issues=(), ic_ratios=None, correction_factor=50, week=0):
+    """Generate realistic CGM-style glucose data based on pump settings"""
+    timestamps, hours, minutes = cgm_time_grid(days)
+    
+    return CGMSeries(
+        timestamps,
+        simulate_week_glucose(hours, minutes, basal_rates, issues, ic_ratios, correction_factor, week)
+    )
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def generate_glucose_weeks(n_weeks, days=7, basal_rates=None, issues=(), ic_ratios=None, correction_factor=50):
+    """Generate weeks 0..n_weeks-1 at once; returns timestamps and an (n_weeks, samples) glucose array"""
+    timestamps, hours, minutes = cgm_time_grid(days)
+    
+    # Fill rows of one preallocated block; each week keeps its own seeded generator so rows
+    # match generate_glucose_data for the same week
+    weekly_glucose = np.empty((n_weeks, hours.size), dtype=np.float32)
+    for week in range(n_weeks):
+        weekly_glucose[week] = simulate_week_glucose(hours, minutes, basal_rates, issues, ic_ratios, correction_factor, week)
+    
+    return timestamps, weekly_glucose
+
+def ic_hour_lookup(ic_ratios):
+    """Return a 24-entry array of the I:C ratio applied at each hour (NaN if unset)"""
+    ratio_by_slot = np.array([ic_ratios.get(meal, np.nan) for meal in MEAL_NAMES], dtype=np.float32)
+    return ratio_by_slot[MEAL_INDEX_BY_HOUR]
+
+def settings_cache_args(settings):
+    """Return pump settings as hashable generate_glucose_data keyword arguments"""
+    return {
+        'basal_rates': tuple(settings['basal_profile'].tolist()),
+        'ic_ratios': tuple(settings['ic_ratios'].items()),
+        'correction_factor': settings['correction_factor']
+    }
+
+# Mock patient data with comprehensive pump settings. Streamlit re-executes this script on
+# every rerun, so the records and their columnar arrays are built once in a cached builder and
+# shared read-only by all sessions; a session's editable settings are copies kept in
+# st.session_state (see patient_settings).
+@st.cache_resource(show_spinner=False)
+def builtin_patient_data():
+    """Return the built-in patients with their (n, 24) basal and (n, 3) A1C arrays"""
+    patients = [
+        {
+            'id': 'pump-001',
+            'name': 'Sarah Chen',
+            'age': 28,
+            'gender': 'Female',
+            'mrn': 'PT001',
+            'diabetes_type': 'Type 1',
+            'duration_diabetes': '15 years',
+            'pump_type': 'Tandem t:slim X2',
+            'cgm_type': 'Dexcom G6',
+            'algorithm': 'Control-IQ',
+            'original_settings': {
+                'basal_profile': [0.8, 0.6, 0.5, 0.5, 0.9, 1.2, 1.0, 0.8, 0.7, 0.7, 0.8, 0.9, 
+                                1.0, 0.8, 0.7, 0.6, 0.8, 1.1, 1.0, 0.9, 0.8, 0.8, 0.8, 0.8],
+                'ic_ratios': {'breakfast': 12, 'lunch': 15, 'dinner': 10},
+                'correction_factor': 50,
+                'target_glucose': 110
+            },
+            'scenario': 'dawn_phenomenon',
+            'description': 'Active professional with consistent dawn phenomenon requiring basal optimization',
+            'clinical_notes': 'Patient reports morning glucose consistently 180-220 mg/dL despite overnight target range. Needs early morning basal adjustment.',
+            'a1c_trend': [7.8, 7.5, 7.2],
+            'learning_objectives': [
+                'Recognize dawn phenomenon pattern in CGM data',
+                'Calculate appropriate basal rate increases for early morning',
+                'Monitor response to basal adjustments over time'
+            ]
         },
-        'scenario': 'post_meal_spikes',
-        'description': 'College student with irregular eating and persistent post-meal highs',
-        'clinical_notes': 'Erratic schedule, frequent missed boluses, post-prandial spikes >300 mg/dL. Needs carb counting education and I:C ratio adjustment.',
-        'a1c_trend': [8.2, 7.9, 8.1],
-        'learning_objectives': [
-            'Analyze post-prandial glucose patterns',
-            'Adjust insulin-to-carb ratios appropriately',
-            'Implement pre-bolusing strategies'
-        ]
-    },
-    {
-        'id': 'pump-004',
-        'name': 'Robert Kim',
-        'age': 45,
-        'gender': 'Male',
-        'mrn': 'PT004',
-        'diabetes_type': 'Type 1',
-        'duration_diabetes': '22 years',
-        'pump_type': 'Tandem t:slim X2',
-        'cgm_type': 'Dexcom G6',
-        'algorithm': 'Control-IQ',
-        'original_settings': {
-            'basal_profile': [1.1, 0.9, 0.8, 0.8, 1.0, 1.3, 1.2, 1.0, 0.9, 0.9, 1.0, 1.1,
-                            1.2, 1.0, 0.7, 0.6, 0.9, 1.2, 1.1, 1.0, 1.0, 1.0, 1.1, 1.1],
-            'ic_ratios': {'breakfast': 8, 'lunch': 10, 'dinner': 7},
-            'correction_factor': 35,
-            'target_glucose': 120
+        {
+            'id': 'pump-002',
+            'name': 'Miguel Rodriguez',
+            'age': 34,
+            'gender': 'Male',
+            'mrn': 'PT002',
+            'diabetes_type': 'Type 1',
+            'duration_diabetes': '8 years',
+            'pump_type': 'Omnipod 5',
+            'cgm_type': 'Dexcom G6',
+            'algorithm': 'SmartAdjust',
+            'original_settings': {
+                'basal_profile': [0.9, 0.8, 0.7, 0.7, 0.8, 0.9, 1.1, 0.9, 0.8, 0.8, 0.9, 1.0,
+                                1.2, 1.0, 0.6, 0.5, 0.8, 1.0, 1.1, 1.0, 0.9, 0.9, 0.9, 0.9],
+                'ic_ratios': {'breakfast': 10, 'lunch': 12, 'dinner': 8},
+                'correction_factor': 45,
+                'target_glucose': 120
+            },
+            'scenario': 'exercise_management',
+            'description': 'Marathon runner struggling with exercise-induced hypoglycemia',
+            'clinical_notes': 'Patient runs 6 miles daily at 4 PM. Frequent lows during and after exercise despite reducing basal. May need exercise mode optimization.',
+            'a1c_trend': [6.9, 7.1, 7.3],
+            'learning_objectives': [
+                'Identify exercise-related hypoglycemia patterns',
+                'Implement temporary basal reductions for exercise',
+                'Understand delayed post-exercise hypoglycemia risk'
+            ]
         },
-        'current_settings': {
-            'basal_profile': [1.1, 0.9, 0.8, 0.8, 1.0, 1.3, 1.2, 1.0, 0.9, 0.9, 1.0, 1.1,
-                            1.2, 1.0, 0.7, 0.6, 0.9, 1.2, 1.1, 1.0, 1.0, 1.0, 1.1, 1.1],
-            'ic_ratios': {'breakfast': 8, 'lunch': 10, 'dinner': 7},
-            'correction_factor': 35,
-            'target_glucose': 120
+        {
+            'id': 'pump-003',
+            'name': 'Jennifer Park',
+            'age': 19,
+            'gender': 'Female',
+            'mrn': 'PT003',
+            'diabetes_type': 'Type 1',
+            'duration_diabetes': '3 years',
+            'pump_type': 'Medtronic 780G',
+            'cgm_type': 'Guardian 4',
+            'algorithm': 'SmartGuard',
+            'original_settings': {
+                'basal_profile': [0.6, 0.5, 0.4, 0.4, 0.6, 0.8, 0.9, 0.7, 0.6, 0.7, 0.8, 0.9,
+                                1.1, 1.3, 0.8, 0.7, 0.9, 1.2, 1.0, 0.8, 0.7, 0.6, 0.6, 0.6],
+                'ic_ratios': {'breakfast': 15, 'lunch': 18, 'dinner': 12},
+                'correction_factor': 60,
+                'target_glucose': 100
+            },
+            'scenario': 'post_meal_spikes',
+            'description': 'College student with irregular eating and persistent post-meal highs',
+            'clinical_notes': 'Erratic schedule, frequent missed boluses, post-prandial spikes >300 mg/dL. Needs carb counting education and I:C ratio adjustment.',
+            'a1c_trend': [8.2, 7.9, 8.1],
+            'learning_objectives': [
+                'Analyze post-prandial glucose patterns',
+                'Adjust insulin-to-carb ratios appropriately',
+                'Implement pre-bolusing strategies'
+            ]
         },
-        'scenario': 'hypoglycemia_unawareness',
-        'description': 'Long-term T1D with hypoglycemia unawareness and frequent severe lows',
-        'clinical_notes': 'Multiple severe hypoglycemia episodes. Needs higher glucose targets and aggressive low prevention strategies.',
-        'a1c_trend': [6.2, 6.8, 7.0],
-        'learning_objectives': [
-            'Recognize hypoglycemia unawareness patterns',
-            'Implement conservative glucose targets',
-            'Balance glycemic control with safety'
-        ]
+        {
+            'id': 'pump-004',
+            'name': 'Robert Kim',
+            'age': 45,
+            'gender': 'Male',
+            'mrn': 'PT004',
+            'diabetes_type': 'Type 1',
+            'duration_diabetes': '22 years',
+            'pump_type': 'Tandem t:slim X2',
+            'cgm_type': 'Dexcom G6',
+            'algorithm': 'Control-IQ',
+            'original_settings': {
+                'basal_profile': [1.1, 0.9, 0.8, 0.8, 1.0, 1.3, 1.2, 1.0, 0.9, 0.9, 1.0, 1.1,
+                                1.2, 1.0, 0.7, 0.6, 0.9, 1.2, 1.1, 1.0, 1.0, 1.0, 1.1, 1.1],
+                'ic_ratios': {'breakfast': 8, 'lunch': 10, 'dinner': 7},
+                'correction_factor': 35,
+                'target_glucose': 120
+            },
+            'scenario': 'hypoglycemia_unawareness',
+            'description': 'Long-term T1D with hypoglycemia unawareness and frequent severe lows',
+            'clinical_notes': 'Multiple severe hypoglycemia episodes. Needs higher glucose targets and aggressive low prevention strategies.',
+            'a1c_trend': [6.2, 6.8, 7.0],
+            'learning_objectives': [
+                'Recognize hypoglycemia unawareness patterns',
+                'Implement conservative glucose targets',
+                'Balance glycemic control with safety'
+            ]
+        }
+    ]
+    
+    # Original basal profiles as one float32 array; each patient's original_settings
+    # holds a read-only row view of it
+    basal = np.array([p['original_settings']['basal_profile'] for p in patients], dtype=np.float32)
+    basal.flags.writeable = False
+    
+    # A1C trends as one array, shared the same way. Kept in float64 so the displayed
+    # percentages match the values entered above.
+    a1c = np.array([p['a1c_trend'] for p in patients])
+    a1c.flags.writeable = False
+    
+    for row, patient in enumerate(patients):
+        patient['original_settings']['basal_profile'] = basal[row]
+        patient['a1c_trend'] = a1c[row]
+    
+    return patients, basal, a1c
+
+PUMP_PATIENTS, PATIENT_BASAL, PATIENT_A1C = builtin_patient_data()
+
+def clone_settings(settings):
+    """Return an independent copy of a pump settings dict"""
+    return {
+        'basal_profile': settings['basal_profile'].copy(),
+        'ic_ratios': dict(settings['ic_ratios']),
+        'correction_factor': settings['correction_factor'],
+        'target_glucose': settings['target_glucose']
     }
-]
-
-def get_pump_color(pump_type):
-    """Return color for pump type"""
-    color_map = {
-        'Tandem t:slim X2': '#3b82f6',
-        'Omnipod 5': '#10b981',
-        'Medtronic 780G': '#8b5cf6'
+
+def patient_settings(patient):
+    """Return this session's editable pump settings for a patient, starting from its originals"""
+    settings_by_id = st.session_state.patient_settings
+    if patient['id'] not in settings_by_id:
+        settings_by_id[patient['id']] = clone_settings(patient['original_settings'])
+    return settings_by_id[patient['id']]
+
+# Hours of the day and their row labels for the hourly basal rate editor
+HOURS_OF_DAY = np.arange(24)
+BASAL_HOUR_LABELS = tuple(f"{hour:02d}:00 - {hour+1:02d}:00" for hour in range(24))
+
+# Badge color per pump type; unknown pumps fall back to gray
+PUMP_COLORS = MappingProxyType({
+    'Tandem t:slim X2': '#3b82f6',
+    'Omnipod 5': '#10b981',
+    'Medtronic 780G': '#8b5cf6'
+})
+
+def build_patient_index(patients):
+    """Return the sorted distinct pump types and clinical scenarios across patients"""
+    return {
+        'pump_types': sorted({p['pump_type'] for p in patients}),
+        'scenarios': sorted({p['scenario'] for p in patients})
     }
-    return color_map.get(pump_type, '#6b7280')
+
+def group_patients(patients, field):
+    """Map each value of a patient field (e.g. 'pump_type') to the patients having it"""
+    groups = {}
+    for patient in patients:
+        groups.setdefault(patient[field], []).append(patient)
+    return MappingProxyType(groups)
+
+# Built-in patients indexed by each filter field and by id; cached so reruns reuse them
+@st.cache_resource(show_spinner=False)
+def builtin_patient_lookups():
+    """Return the built-in patients grouped by pump type, by scenario, and keyed by id"""
+    patients = builtin_patient_data()[0]
+    return (
+        group_patients(patients, 'pump_type'),
+        group_patients(patients, 'scenario'),
+        MappingProxyType({p['id']: p for p in patients})
+    )
+
+PATIENTS_BY_PUMP, PATIENTS_BY_SCENARIO, PATIENTS_BY_ID = builtin_patient_lookups()
+
+def find_patient(patient_id, custom_patients):
+    """Return the built-in or custom patient with the given id, or None if it no longer exists"""
+    if patient_id in PATIENTS_BY_ID:
+        return PATIENTS_BY_ID[patient_id]
+    return next((p for p in custom_patients if p['id'] == patient_id), None)
+
+def filter_patients(custom_patients, pump_type=None, scenario=None):
+    """Return built-in then custom patients matching the filters (None matches all)"""
+    if pump_type is None and scenario is None:
+        return PUMP_PATIENTS + custom_patients
+    
+    if scenario is None:
+        matches = PATIENTS_BY_PUMP.get(pump_type, [])
+    elif pump_type is None:
+        matches = PATIENTS_BY_SCENARIO.get(scenario, [])
+    else:
+        scenario_ids = {p['id'] for p in PATIENTS_BY_SCENARIO.get(scenario, [])}
+        matches = [p for p in PATIENTS_BY_PUMP.get(pump_type, []) if p['id'] in scenario_ids]
+    
+    return matches + [
+        p for p in custom_patients
+        if pump_type in (None, p['pump_type']) and scenario in (None, p['scenario'])
+    ]
 
 def render_patient_card(patient):
     """Render patient information card"""
@@ -354,7 +574,7 @@ def render_patient_card(patient):
             st.markdown(f"📋 {patient['mrn']} • {patient['diabetes_type']} • {patient['duration_diabetes']}")
             
             # Pump and algorithm badges
-            pump_color = get_pump_color(patient['pump_type'])
+            pump_color = PUMP_COLORS.get(patient['pump_type'], '#6b7280')
             st.markdown(f"""
             <div style="margin-top: 8px;">
                 <span class="pump-badge" style="background-color: {pump_color};">
@@ -370,27 +590,84 @@ def render_patient_card(patient):
             current_a1c = patient['a1c_trend'][-1]
             st.metric("Current A1C", f"{current_a1c}%")
 
-def create_glucose_plot(df, title="Continuous Glucose Monitor", highlight_periods=None):
+def patient_table(patients, labels):
+    """Summarize patients as one row each for the selection table, with scenario display names from labels"""
+    return pd.DataFrame({
+        'Patient': [p['name'] for p in patients],
+        'Age': [p['age'] for p in patients],
+        'Pump': [p['pump_type'] for p in patients],
+        'Algorithm': [p['algorithm'] for p in patients],
+        'Scenario': [labels[p['scenario']] for p in patients],
+        'Current A1C (%)': [p['a1c_trend'][-1] for p in patients]
+    })
+
+def lttb_indices(values, n_out):
+    """Indices of a Largest-Triangle-Three-Buckets downsample of an evenly spaced series"""
+    n_samples = values.size
+    if n_out >= n_samples or n_out < 3:
+        return np.arange(n_samples)
+    
+    # First and last points are always kept; the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n_samples - 1, n_out - 1).astype(np.intp)
+    y = values.astype(np.float64)
+    selected = np.empty(n_out, dtype=np.intp)
+    selected[0], selected[-1] = 0, n_samples - 1
+    
+    prev = 0
+    for bucket in range(n_out - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # Third triangle vertex: the mean of the next bucket (the last point for the final bucket)
+        next_start, next_end = (edges[bucket + 1], edges[bucket + 2]) if bucket < n_out - 3 else (n_samples - 1, n_samples)
+        avg_x = (next_start + next_end - 1) / 2
+        avg_y = y[next_start:next_end].mean()
+        
+        candidates = np.arange(start, end)
+        areas = np.abs((prev - avg_x) * (y[start:end] - y[prev]) - (prev - candidates) * (avg_y - y[prev]))
+        prev = start + int(np.argmax(areas))
+        selected[bucket + 1] = prev
+    
+    return selected
+
+def downsample_glucose(series, target=400):
+    """Reduce a glucose series to `target` points with LTTB, preserving peaks and troughs"""
+    keep = lttb_indices(series.glucose, target)
+    return CGMSeries(series.timestamps[keep], series.glucose[keep])
+
+def epoch_ms(timestamps):
+    """Convert datetime64 timestamps to float64 epoch milliseconds for a Plotly date axis"""
+    # plotly >= 6 sends numeric arrays as base64 typed arrays, unlike datetime strings
+    return timestamps.astype('datetime64[ms]').astype(np.float64)
+
+def hash_glucose_series(series):
+    """Cheap content hash of a CGMSeries for st.cache_data keys"""
+    digest = hashlib.blake2b(series.glucose.tobytes(), digest_size=16)
+    digest.update(series.timestamps.tobytes())
+    return digest.digest()
+
+# Marker colors for glucose categories 0 (low, amber), 1 (high, red) and 2 (target, green)
+GLUCOSE_RANGE_COLORSCALE = [[0.0, '#f59e0b'], [0.5, '#ef4444'], [1.0, '#10b981']]
+
+# Figures are rebuilt only when the plotted data or title change
+@st.cache_data(max_entries=64, show_spinner=False, hash_funcs={CGMSeries: hash_glucose_series})
+def create_glucose_plot(series, title="Continuous Glucose Monitor", highlight_periods=None):
     """Create an interactive glucose plot"""
     fig = go.Figure()
     
-    # Color glucose values by range
-    colors = []
-    for glucose in df['glucose']:
-        if glucose < 70:
-            colors.append('#f59e0b')  # Low - amber
-        elif glucose > 180:
-            colors.append('#ef4444')  # High - red  
-        else:
-            colors.append('#10b981')  # Target - green
+    # Plot a downsampled series; metrics are still computed on the full-resolution data
+    series = downsample_glucose(series)
+    
+    # Color glucose values by range as int8 categories mapped through GLUCOSE_RANGE_COLORSCALE;
+    # plotly >= 6 ships them as a compact int8 typed array rather than per-point color strings
+    glucose = series.glucose
+    categories = np.select([glucose < 70, glucose > 180], [0, 1], default=2).astype(np.int8)
     
-    fig.add_trace(go.Scatter(
-        x=df['timestamp'],
-        y=df['glucose'],
+    fig.add_trace(go.Scattergl(
+        x=epoch_ms(series.timestamps),
+        y=series.glucose,
         mode='lines+markers',
         name='Glucose',
         line=dict(width=2),
-        marker=dict(size=3, color=colors),
+        marker=dict(size=3, color=categories, colorscale=GLUCOSE_RANGE_COLORSCALE, cmin=0, cmax=2),
         hovertemplate='%{x}<br>Glucose: %{y} mg/dL<extra></extra>'
     ))
     
@@ -411,6 +688,7 @@ def create_glucose_plot(df, title="Continuous Glucose Monitor", highlight_period
     fig.update_layout(
         title=title,
         xaxis_title='Time',
+        xaxis=dict(type='date'),
         yaxis_title='Glucose (mg/dL)',
         height=400,
         showlegend=False,
@@ -419,15 +697,75 @@ def create_glucose_plot(df, title="Continuous Glucose Monitor", highlight_period
     
     return fig
 
-def calculate_glucose_metrics(df):
-    """Calculate key glucose metrics"""
+# Rebuilt only when either trace changes
+@st.cache_data(max_entries=64, show_spinner=False, hash_funcs={CGMSeries: hash_glucose_series})
+def create_comparison_plot(before, after):
+    """Create stacked before/after CGM plots for an adjustment"""
+    from plotly.subplots import make_subplots  # Deferred: only needed after an adjustment
+    
+    fig_comparison = make_subplots(
+        rows=2, cols=1,
+        subplot_titles=('Before Adjustments', 'After Adjustments (Predicted)')
+    )
+    
+    before_plot = downsample_glucose(before)
+    after_plot = downsample_glucose(after)
+    fig_comparison.add_trace(
+        go.Scattergl(x=epoch_ms(before_plot.timestamps), 
+                    y=before_plot.glucose,
+                    name='Before', line=dict(color='red')),
+        row=1, col=1
+    )
+    
+    fig_comparison.add_trace(
+        go.Scattergl(x=epoch_ms(after_plot.timestamps), y=after_plot.glucose,
+                    name='After', line=dict(color='green')),
+        row=2, col=1
+    )
+    
+    # Add target ranges
+    for row in [1, 2]:
+        fig_comparison.add_hrect(y0=70, y1=180, fillcolor="green", opacity=0.1, 
+                               line_width=0, row=row, col=1)
+    
+    fig_comparison.update_layout(height=600, title="Glucose Response Comparison")
+    fig_comparison.update_xaxes(type='date')
+    fig_comparison.update_yaxes(range=[40, 400])
+    
+    return fig_comparison
+
+# Rates are passed as tuples so each original/current pair is built once
+@st.cache_data(max_entries=64, show_spinner=False)
+def create_basal_plot(original_rates, current_rates):
+    """Create a line chart comparing original and current hourly basal rates"""
+    fig = go.Figure()
+    for name, rates in (('Original', original_rates), ('Current', current_rates)):
+        fig.add_trace(go.Scatter(x=HOURS_OF_DAY, y=rates, mode='lines', name=name))
+    
+    fig.update_layout(
+        title="Basal Rate Comparison",
+        xaxis_title='Hour',
+        yaxis_title='Rate (U/hr)'
+    )
+    
+    return fig
+
+# Bin edges splitting glucose into low (<70), target (70-180 inclusive) and high (>180)
+GLUCOSE_RANGE_EDGES = np.array([70, np.nextafter(180, np.inf)])
+
+@st.cache_data(max_entries=256, show_spinner=False)
+def calculate_glucose_metrics(glucose):
+    """Calculate key glucose metrics from an array of glucose values"""
+    # Percent of samples below, within and above the target range, from one binning pass
+    below, in_range, above = np.bincount(np.digitize(glucose, GLUCOSE_RANGE_EDGES), minlength=3) / glucose.size * 100
+    
     metrics = {}
-    metrics['time_in_range'] = len(df[(df['glucose'] >= 70) & (df['glucose'] <= 180)]) / len(df) * 100
-    metrics['time_below_70'] = len(df[df['glucose'] < 70]) / len(df) * 100
-    metrics['time_above_180'] = len(df[df['glucose'] > 180]) / len(df) * 100
-    metrics['mean_glucose'] = df['glucose'].mean()
+    metrics['time_in_range'] = float(in_range)
+    metrics['time_below_70'] = float(below)
+    metrics['time_above_180'] = float(above)
+    metrics['mean_glucose'] = glucose.mean(dtype=np.float64)  # Accumulate float32 samples in float64
     metrics['gmi'] = (3.31 + 0.02392 * metrics['mean_glucose'])  # Glucose Management Indicator
-    metrics['cv'] = (df['glucose'].std() / metrics['mean_glucose']) * 100  # Coefficient of variation
+    metrics['cv'] = (glucose.std(ddof=1, dtype=np.float64) / metrics['mean_glucose']) * 100  # Coefficient of variation
     
     return metrics
 
@@ -468,12 +806,10 @@ def render_glucose_metrics(metrics):
 
 def create_adjustment_interface(patient, week):
     """Create interactive interface for making pump adjustments"""
-    st.markdown(f"""
-    <div class="adjustment-panel">
-        <h3>🎯 Week {week + 1} - Interactive Pump Adjustments</h3>
-        <p>Review the glucose patterns above and adjust the pump settings below. Your changes will be reflected in real-time.</p>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(ADJUSTMENT_PANEL_HTML.substitute(week=week + 1), unsafe_allow_html=True)
+    
+    current = patient_settings(patient)
+    ic_ratios = current['ic_ratios']
     
     # Create tabs for different adjustment types
     adj_tabs = st.tabs(["📊 Basal Rates", "🍽️ I:C Ratios", "💉 Correction Factor", "🎯 Target Glucose"])
@@ -486,22 +822,26 @@ def create_adjustment_interface(patient, week):
         
         col1, col2 = st.columns([2, 1])
         with col1:
-            # Create input fields for basal rates
-            new_basal = []
-            for hour in range(24):
-                current_rate = patient['current_settings']['basal_profile'][hour]
-                new_rate = st.number_input(
-                    f"{hour:02d}:00 - {hour+1:02d}:00",
-                    min_value=0.0,
-                    max_value=5.0,
-                    value=current_rate,
-                    step=0.1,
-                    key=f"basal_{hour}",
-                    format="%.1f"
-                )
-                new_basal.append(new_rate)
-                if new_rate != current_rate:
-                    settings_changed = True
+            # Edit all 24 hourly rates in one table so a change triggers a single rerun
+            current_basal = current['basal_profile']
+            basal_table = pd.DataFrame({
+                'Time': BASAL_HOUR_LABELS,
+                'Rate': current_basal.astype(float)
+            })
+            edited_table = st.data_editor(
+                basal_table,
+                column_config={
+                    'Time': st.column_config.TextColumn(disabled=True),
+                    'Rate': st.column_config.NumberColumn(
+                        "Rate (U/hr)", min_value=0.0, max_value=5.0, step=0.1, format="%.1f", required=True
+                    )
+                },
+                hide_index=True,
+                key=f"basal_editor_{patient['id']}"
+            )
+            new_basal = edited_table['Rate'].to_numpy(dtype=np.float32)
+            if not np.array_equal(new_basal, current_basal):
+                settings_changed = True
         
         with col2:
             st.write("**Safety Guidelines:**")
@@ -511,17 +851,14 @@ def create_adjustment_interface(patient, week):
             st.write("• Exercise periods: Decrease 1-2 hrs before")
             
             if st.button("📈 Visualize Basal Profile"):
-                basal_df = pd.DataFrame({
-                    'Hour': range(24),
-                    'Original': patient['original_settings']['basal_profile'],
-                    'Current': new_basal
-                })
-                fig = px.line(basal_df, x='Hour', y=['Original', 'Current'], 
-                             title="Basal Rate Comparison")
+                fig = create_basal_plot(
+                    tuple(patient['original_settings']['basal_profile'].tolist()),
+                    tuple(new_basal.tolist())
+                )
                 st.plotly_chart(fig, use_container_width=True)
         
         if settings_changed:
-            patient['current_settings']['basal_profile'] = new_basal
+            current['basal_profile'] = new_basal
     
     with adj_tabs[1]:
         st.subheader("Insulin-to-Carbohydrate Ratios")
@@ -530,7 +867,7 @@ def create_adjustment_interface(patient, week):
         col1, col2 = st.columns(2)
         with col1:
             for meal in ['breakfast', 'lunch', 'dinner']:
-                current_ratio = patient['current_settings']['ic_ratios'][meal]
+                current_ratio = ic_ratios[meal]
                 new_ratio = st.number_input(
                     f"{meal.title()} (1 unit per X grams carbs)",
                     min_value=5,
@@ -540,7 +877,7 @@ def create_adjustment_interface(patient, week):
                     key=f"ic_{meal}"
                 )
                 if new_ratio != current_ratio:
-                    patient['current_settings']['ic_ratios'][meal] = new_ratio
+                    ic_ratios[meal] = new_ratio
                     settings_changed = True
         
         with col2:
@@ -552,7 +889,7 @@ def create_adjustment_interface(patient, week):
     
     with adj_tabs[2]:
         st.subheader("Correction Factor (Insulin Sensitivity)")
-        current_cf = patient['current_settings']['correction_factor']
+        current_cf = current['correction_factor']
         new_cf = st.number_input(
             "Correction Factor (1 unit drops BG by X mg/dL)",
             min_value=20,
@@ -562,7 +899,7 @@ def create_adjustment_interface(patient, week):
             key="correction_factor"
         )
         if new_cf != current_cf:
-            patient['current_settings']['correction_factor'] = new_cf
+            current['correction_factor'] = new_cf
             settings_changed = True
         
         st.write(f"**Current Setting:** 1 unit drops BG by {new_cf} mg/dL")
@@ -570,7 +907,7 @@ def create_adjustment_interface(patient, week):
     
     with adj_tabs[3]:
         st.subheader("Target Glucose Level")
-        current_target = patient['current_settings']['target_glucose']
+        current_target = current['target_glucose']
         new_target = st.number_input(
             "Target Glucose (mg/dL)",
             min_value=80,
@@ -580,7 +917,7 @@ def create_adjustment_interface(patient, week):
             key="target_glucose"
         )
         if new_target != current_target:
-            patient['current_settings']['target_glucose'] = new_target
+            current['target_glucose'] = new_target
             settings_changed = True
         
         st.write("**Note:** Higher targets reduce hypoglycemia risk but may increase A1C")
@@ -645,33 +982,34 @@ def create_professor_interface():
             
             if submit_scenario:
                 try:
-                    basal_list = [float(x.strip()) for x in basal_input.split(',')]
-                    if len(basal_list) != 24:
+                    # numpy 1.x only warns on unparsable text (and truncates); make that an error too
+                    with warnings.catch_warnings():
+                        warnings.simplefilter('error', DeprecationWarning)
+                        basal_list = np.fromstring(basal_input, dtype=np.float32, sep=',')
+                    if basal_list.size != 24:
                         st.error("Please enter exactly 24 basal rates (one for each hour)")
                     else:
+                        original_settings = {
+                            'basal_profile': basal_list,
+                            'ic_ratios': {'breakfast': breakfast_ic, 'lunch': lunch_ic, 'dinner': dinner_ic},
+                            'correction_factor': correction_factor,
+                            'target_glucose': target_glucose
+                        }
+                        # Number scenarios by creation count so ids stay unique after deletions
+                        st.session_state.custom_scenarios_created += 1
+                        scenario_number = st.session_state.custom_scenarios_created
                         new_scenario = {
-                            'id': f'custom-{len(st.session_state.custom_scenarios)+1}',
+                            'id': f'custom-{scenario_number}',
                             'name': name,
                             'age': age,
                             'gender': gender,
-                            'mrn': f'CUSTOM-{len(st.session_state.custom_scenarios)+1:03d}',
+                            'mrn': f'CUSTOM-{scenario_number:03d}',
                             'diabetes_type': 'Type 1',
                             'duration_diabetes': diabetes_duration,
                             'pump_type': pump_type,
                             'cgm_type': cgm_type,
                             'algorithm': 'SmartAdjust' if pump_type == 'Omnipod 5' else 'Control-IQ',
-                            'original_settings': {
-                                'basal_profile': basal_list,
-                                'ic_ratios': {'breakfast': breakfast_ic, 'lunch': lunch_ic, 'dinner': dinner_ic},
-                                'correction_factor': correction_factor,
-                                'target_glucose': target_glucose
-                            },
-                            'current_settings': {
-                                'basal_profile': basal_list.copy(),
-                                'ic_ratios': {'breakfast': breakfast_ic, 'lunch': lunch_ic, 'dinner': dinner_ic},
-                                'correction_factor': correction_factor,
-                                'target_glucose': target_glucose
-                            },
+                            'original_settings': original_settings,
                             'scenario': scenario_type,
                             'description': description,
                             'clinical_notes': clinical_notes,
@@ -679,15 +1017,16 @@ def create_professor_interface():
                             'learning_objectives': [obj1, obj2, obj3]
                         }
                         st.session_state.custom_scenarios.append(new_scenario)
+                        st.session_state.patient_index = None
                         st.success(f"Created scenario for {name}!")
-                except ValueError:
+                except (ValueError, DeprecationWarning):
                     st.error("Please enter valid numeric values for basal rates")
     
     with scenario_tabs[1]:
         st.subheader("Manage Custom Scenarios")
         
         if st.session_state.custom_scenarios:
-            for scenario in st.session_state.custom_scenarios:
+            for idx, scenario in enumerate(st.session_state.custom_scenarios):
                 with st.expander(f"{scenario['name']} - {scenario['scenario']}"):
                     col1, col2, col3 = st.columns([2, 2, 1])
                     with col1:
@@ -699,7 +1038,9 @@ def create_professor_interface():
                         st.write(f"**A1C Trend:** {scenario['a1c_trend']}")
                     with col3:
                         if st.button("Delete", key=f"delete_{scenario['id']}"):
-                            st.session_state.custom_scenarios.remove(scenario)
+                            st.session_state.custom_scenarios.pop(idx)
+                            st.session_state.patient_settings.pop(scenario['id'], None)
+                            st.session_state.patient_index = None
                             st.rerun()
         else:
             st.info("No custom scenarios created yet.")
@@ -717,69 +1058,95 @@ def create_professor_interface():
         
         st.write("*Note: Full analytics would integrate with LMS systems*")
 
+# Runs as a fragment: widget interactions inside the journey rerun only this function,
+# not the sidebar and the rest of main()
+def advance_week(total_weeks):
+    """Button callback: move to the next week, or record completion after the last one"""
+    if st.session_state.current_week < total_weeks - 1:
+        st.session_state.current_week += 1
+        st.session_state.adjustment_made = False
+        st.session_state.journey_message = None
+    else:
+        st.session_state.journey_message = "🎉 Patient journey completed! Excellent work mastering pump management."
+        st.session_state.learning_stats['patients_completed'] += 1
+
+def review_previous_week():
+    """Button callback: step back one week"""
+    st.session_state.current_week -= 1
+    st.session_state.adjustment_made = False
+    st.session_state.journey_message = None
+
+@st.fragment
 def create_learning_journey(patient):
     """Enhanced learning journey with interactive adjustments"""
     st.markdown(f"# 👤 {patient['name']} - Interactive Pump Management")
     
+    week = st.session_state.current_week
+    current = patient_settings(patient)
+    issues = (patient['scenario'],)
+    
     # Journey progress
     total_weeks = 12
-    progress = st.session_state.current_week / total_weeks
+    progress = week / total_weeks
     st.progress(progress)
-    st.write(f"Week {st.session_state.current_week + 1} of {total_weeks}")
-    
-    # Patient scenario description
-    st.markdown(f"""
-    <div class="info-box">
-        <strong>Clinical Scenario:</strong> {patient['description']}<br>
-        <strong>Primary Challenge:</strong> {patient['clinical_notes']}<br>
-        <strong>Learning Objectives:</strong><br>
-    """, unsafe_allow_html=True)
-    
-    if 'learning_objectives' in patient:
-        for obj in patient['learning_objectives']:
-            st.markdown(f"• {obj}")
-    st.markdown("</div>", unsafe_allow_html=True)
-    
-    # Generate glucose data based on current settings
-    glucose_df = generate_glucose_data(
-        days=7, 
-        basal_rates=patient['current_settings']['basal_profile'],
-        issues=[patient['scenario']],
-        ic_ratios=patient['current_settings']['ic_ratios'],
-        correction_factor=patient['current_settings']['correction_factor'],
-        week=st.session_state.current_week
-    )
+    st.write(f"Week {week + 1} of {total_weeks}")
     
-    # Store current data for comparison
-    if not st.session_state.adjustment_made:
-        st.session_state.current_glucose_data = glucose_df
+    # Patient scenario description, emitted as a single element; custom scenarios supply
+    # these fields as free text, so all of them are escaped
+    objectives_html = "".join(f"<li>{html.escape(obj)}</li>" for obj in patient.get('learning_objectives', []))
+    st.markdown(SCENARIO_INFO_HTML.substitute(
+        description=html.escape(patient['description']),
+        clinical_notes=html.escape(patient['clinical_notes']),
+        objectives=objectives_html
+    ), unsafe_allow_html=True)
+    
+    # Reruns that leave the patient, week and settings unchanged reuse the last rendered
+    # series, figure and metrics without touching the data or plot caches
+    settings_args = settings_cache_args(current)
+    view_key = (patient['id'], patient['scenario'], week, tuple(settings_args.values()))
+    cached_view = st.session_state.journey_view
+    if cached_view is not None and cached_view[0] == view_key:
+        _, glucose_series, fig, metrics = cached_view
+    else:
+        # Glucose data for every week under the current settings, so switching weeks is a row lookup
+        timestamps, weekly_glucose = generate_glucose_weeks(
+            total_weeks,
+            days=7,
+            issues=issues,
+            **settings_args
+        )
+        glucose_series = CGMSeries(timestamps, weekly_glucose[week])
+        fig = create_glucose_plot(glucose_series, f"Week {week + 1} - Current Settings")
+        metrics = calculate_glucose_metrics(glucose_series.glucose)
+        st.session_state.journey_view = (view_key, glucose_series, fig, metrics)
     
     # Display glucose plot
     st.subheader("📈 Continuous Glucose Monitor Data")
-    fig = create_glucose_plot(glucose_df, f"Week {st.session_state.current_week + 1} - Current Settings")
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(fig, use_container_width=True, key=f"cgm_{patient['id']}")
     
-    # Calculate and display metrics
+    # Display metrics
     st.subheader("📊 Current Glucose Metrics")
-    metrics = calculate_glucose_metrics(glucose_df)
     render_glucose_metrics(metrics)
     
+    # Store current data and its metrics for the before/after comparison
+    if not st.session_state.adjustment_made:
+        st.session_state.current_glucose_data = glucose_series
+        st.session_state.current_glucose_metrics = metrics
+    
     # Interactive adjustment interface
-    if st.session_state.current_week < 8:  # Allow adjustments in first 8 weeks
-        settings_changed = create_adjustment_interface(patient, st.session_state.current_week)
+    if week < 8:  # Allow adjustments in first 8 weeks
+        settings_changed = create_adjustment_interface(patient, week)
         
         if settings_changed:
             st.session_state.adjustment_made = True
             st.session_state.learning_stats['adjustments_made'] += 1
             
             # Generate new glucose data with adjusted settings
-            new_glucose_df = generate_glucose_data(
+            new_glucose_series = generate_glucose_data(
                 days=7,
-                basal_rates=patient['current_settings']['basal_profile'],
-                issues=[patient['scenario']],
-                ic_ratios=patient['current_settings']['ic_ratios'],
-                correction_factor=patient['current_settings']['correction_factor'],
-                week=st.session_state.current_week + 1  # Simulate improvement
+                issues=issues,
+                week=week + 1,  # Simulate improvement
+                **settings_cache_args(current)
             )
             
             # Show comparison
@@ -788,69 +1155,28 @@ def create_learning_journey(patient):
             col1, col2 = st.columns(2)
             with col1:
                 st.markdown("**Before Adjustments:**")
-                old_metrics = calculate_glucose_metrics(st.session_state.current_glucose_data)
+                old_metrics = st.session_state.current_glucose_metrics
                 render_glucose_metrics(old_metrics)
             
             with col2:
                 st.markdown("**After Adjustments (Predicted):**")
-                new_metrics = calculate_glucose_metrics(new_glucose_df)
+                new_metrics = calculate_glucose_metrics(new_glucose_series.glucose)
                 render_glucose_metrics(new_metrics)
             
-            # Show side-by-side comparison
-            fig_comparison = make_subplots(
-                rows=2, cols=1,
-                subplot_titles=('Before Adjustments', 'After Adjustments (Predicted)')
-            )
-            
-            fig_comparison.add_trace(
-                go.Scatter(x=st.session_state.current_glucose_data['timestamp'], 
-                          y=st.session_state.current_glucose_data['glucose'],
-                          name='Before', line=dict(color='red')),
-                row=1, col=1
-            )
-            
-            fig_comparison.add_trace(
-                go.Scatter(x=new_glucose_df['timestamp'], y=new_glucose_df['glucose'],
-                          name='After', line=dict(color='green')),
-                row=2, col=1
-            )
-            
-            # Add target ranges
-            for row in [1, 2]:
-                fig_comparison.add_hrect(y0=70, y1=180, fillcolor="green", opacity=0.1, 
-                                       line_width=0, row=row, col=1)
-            
-            fig_comparison.update_layout(height=600, title="Glucose Response Comparison")
-            fig_comparison.update_yaxes(range=[40, 400])
-            st.plotly_chart(fig_comparison, use_container_width=True)
+            # Side-by-side comparison chart, collapsed by default since the metric panels above carry the summary
+            with st.expander("📈 Show Before/After chart", expanded=False):
+                fig_comparison = create_comparison_plot(st.session_state.current_glucose_data, new_glucose_series)
+                st.plotly_chart(fig_comparison, use_container_width=True, key=f"comparison_{patient['id']}")
             
             # Clinical feedback
             tir_improvement = new_metrics['time_in_range'] - old_metrics['time_in_range']
             if tir_improvement > 5:
-                st.markdown(f"""
-                <div class="success-outcome">
-                <strong>Excellent Adjustment!</strong><br>
-                Your changes improved Time in Range by {tir_improvement:.1f}%. 
-                This demonstrates good clinical reasoning in pump management.
-                </div>
-                """, unsafe_allow_html=True)
+                st.markdown(EXCELLENT_ADJUSTMENT_HTML.substitute(tir=f"{tir_improvement:.1f}"), unsafe_allow_html=True)
                 st.session_state.learning_stats['successful_outcomes'] += 1
             elif tir_improvement > 0:
-                st.markdown(f"""
-                <div class="success-outcome">
-                <strong>Good Adjustment!</strong><br>
-                Time in Range improved by {tir_improvement:.1f}%. 
-                Consider additional fine-tuning for optimal results.
-                </div>
-                """, unsafe_allow_html=True)
+                st.markdown(GOOD_ADJUSTMENT_HTML.substitute(tir=f"{tir_improvement:.1f}"), unsafe_allow_html=True)
             else:
-                st.markdown("""
-                <div class="warning-outcome">
-                <strong>Consider Alternative Approach</strong><br>
-                This adjustment may not improve glucose control. 
-                Review the patterns and consider different settings.
-                </div>
-                """, unsafe_allow_html=True)
+                st.markdown(POOR_ADJUSTMENT_HTML, unsafe_allow_html=True)
     
     else:
         st.info("This is the maintenance phase. In clinical practice, continue monitoring and make minor adjustments as needed.")
@@ -858,31 +1184,28 @@ def create_learning_journey(patient):
     # Week progression controls
     col1, col2, col3 = st.columns([1,2,1])
     with col2:
-        if st.button("➡️ Advance to Next Week", type="primary"):
-            if st.session_state.current_week < total_weeks - 1:
-                st.session_state.current_week += 1
-                st.session_state.adjustment_made = False
-                st.rerun()
-            else:
-                st.success("🎉 Patient journey completed! Excellent work mastering pump management.")
-                st.session_state.learning_stats['patients_completed'] += 1
+        # Week changes happen in on_click callbacks, before the click's own (fragment) rerun
+        advanced = st.button("➡️ Advance to Next Week", type="primary", on_click=advance_week, args=(total_weeks,))
+        if advanced and st.session_state.journey_message:
+            # Full rerun so the sidebar progress outside this fragment picks up the completion
+            st.rerun()
+        
+        if st.session_state.journey_message:
+            st.success(st.session_state.journey_message)
         
         if st.session_state.current_week > 0:
-            if st.button("⬅️ Review Previous Week"):
-                st.session_state.current_week -= 1
-                st.session_state.adjustment_made = False
-                st.rerun()
+            st.button("⬅️ Review Previous Week", on_click=review_previous_week)
+
+@st.cache_data(show_spinner=False)
+def scenario_labels(scenario_keys):
+    """Map scenario keys to display labels, e.g. 'dawn_phenomenon' -> 'Dawn Phenomenon'"""
+    return {key: key.replace('_', ' ').title() for key in scenario_keys}
 
 def main():
     """Enhanced main application with professor mode"""
     
     # Header
-    st.markdown("""
-    <div class="main-header">
-        <h1>💉 Enhanced Insulin Pump Therapy Platform</h1>
-        <h3>Interactive Learning with Real-Time Adjustments</h3>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(MAIN_HEADER_HTML, unsafe_allow_html=True)
     
     # Sidebar
     st.sidebar.title("🎯 Learning Dashboard")
@@ -896,36 +1219,39 @@ def main():
         return
     
     # Learning progress
-    st.sidebar.markdown("### 📈 Your Progress")
-    st.sidebar.metric("Patients Completed", st.session_state.learning_stats['patients_completed'])
-    st.sidebar.metric("Adjustments Made", st.session_state.learning_stats['adjustments_made'])
-    st.sidebar.metric("Successful Outcomes", st.session_state.learning_stats['successful_outcomes'])
+    stats = st.session_state.learning_stats
+    st.sidebar.markdown(PROGRESS_TABLE_MD.format(**stats))
     
     # Patient filter options
     st.sidebar.markdown("### 🔍 Patient Filters")
     
-    # Combine built-in and custom patients
-    all_patients = PUMP_PATIENTS + st.session_state.custom_scenarios
+    custom_patients = st.session_state.custom_scenarios
+    
+    # Filter options only change when a custom scenario is created or deleted
+    if st.session_state.patient_index is None:
+        st.session_state.patient_index = build_patient_index(PUMP_PATIENTS + custom_patients)
+    patient_index = st.session_state.patient_index
     
     pump_filter = st.sidebar.selectbox(
         "Filter by Pump Type",
-        ["All"] + list(set([p['pump_type'] for p in all_patients]))
+        ["All"] + patient_index['pump_types']
     )
+    labels = scenario_labels(tuple(patient_index['scenarios']))
     scenario_filter = st.sidebar.selectbox(
         "Filter by Clinical Scenario", 
-        ["All"] + list(set([p['scenario'].replace('_', ' ').title() for p in all_patients]))
+        ["All"] + list(labels.values())
     )
     
     # Filter patients
-    filtered_patients = all_patients
-    if pump_filter != "All":
-        filtered_patients = [p for p in filtered_patients if p['pump_type'] == pump_filter]
-    if scenario_filter != "All":
-        scenario_key = scenario_filter.lower().replace(' ', '_')
-        filtered_patients = [p for p in filtered_patients if p['scenario'] == scenario_key]
-    
-    # Main content
-    if st.session_state.selected_patient is None:
+    filtered_patients = filter_patients(
+        custom_patients,
+        pump_type=None if pump_filter == "All" else pump_filter,
+        scenario=None if scenario_filter == "All" else {label: key for key, label in labels.items()}[scenario_filter]
+    )
+    
+    # Main content; session state keeps only the selected patient's id
+    selected_patient = find_patient(st.session_state.selected_patient_id, custom_patients)
+    if selected_patient is None:
         # Patient selection page
         st.markdown("## 👥 Select a Patient Journey")
         st.markdown("Choose a patient to begin their interactive pump therapy management journey with real-time adjustments and immediate feedback.")
@@ -933,32 +1259,45 @@ def main():
         # Overview stats
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Total Patients", len(all_patients))
+            st.metric("Total Patients", len(PUMP_PATIENTS) + len(custom_patients))
         with col2:
-            st.metric("Pump Types", len(set([p['pump_type'] for p in all_patients])))
+            st.metric("Pump Types", len(patient_index['pump_types']))
         with col3:
-            st.metric("Clinical Scenarios", len(set([p['scenario'] for p in all_patients])))
+            st.metric("Clinical Scenarios", len(patient_index['scenarios']))
         with col4:
             st.metric("Interactive Weeks", "12 per patient")
         
         st.markdown("---")
         
-        # Patient selection cards
-        for patient in filtered_patients:
-            with st.container():
-                col1, col2 = st.columns([4, 1])
-                with col1:
-                    render_patient_card(patient)
-                    # Show if it's a custom scenario
-                    if patient['id'].startswith('custom-'):
-                        st.markdown("🏫 **Custom Scenario**")
-                with col2:
-                    st.markdown("<br>", unsafe_allow_html=True)
-                    if st.button("Start Journey", key=f"select_{patient['id']}"):
-                        st.session_state.selected_patient = patient
-                        st.session_state.current_week = 0
-                        st.session_state.adjustment_made = False
-                        st.rerun()
+        # Patient overview table with a single picker, instead of a card and button per patient
+        if filtered_patients:
+            st.dataframe(patient_table(filtered_patients, labels), hide_index=True, use_container_width=True)
+            
+            patients_by_id = {p['id']: p for p in filtered_patients}
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                chosen_id = st.selectbox(
+                    "Choose a patient",
+                    list(patients_by_id),
+                    format_func=lambda patient_id: f"{patients_by_id[patient_id]['name']} ({patients_by_id[patient_id]['mrn']})",
+                    key="patient_choice"
+                )
+                patient = patients_by_id[chosen_id]
+                render_patient_card(patient)
+                # Show if it's a custom scenario
+                if patient['id'].startswith('custom-'):
+                    st.markdown("🏫 **Custom Scenario**")
+            with col2:
+                st.markdown("<br>", unsafe_allow_html=True)
+                if st.button("Start Journey", key="start_journey"):
+                    st.session_state.selected_patient_id = patient['id']
+                    st.session_state.patient_settings[patient['id']] = clone_settings(patient['original_settings'])
+                    st.session_state.current_week = 0
+                    st.session_state.adjustment_made = False
+                    st.session_state.journey_message = None
+                    st.rerun()
+        else:
+            st.info("No patients match the selected filters.")
         
         # Educational content section
         st.markdown("---")
@@ -985,7 +1324,7 @@ def main():
     
     else:
         # Patient journey page
-        patient = st.session_state.selected_patient
+        patient = selected_patient
         
         # Header with patient info and back button
         col1, col2 = st.columns([4, 1])
@@ -993,9 +1332,16 @@ def main():
             st.markdown(f"## {patient['pump_type']} with {patient['algorithm']}")
         with col2:
             if st.button("← Back to Patients"):
-                st.session_state.selected_patient = None
-                st.session_state.current_week = 0
-                st.session_state.adjustment_made = False
+                # Release the finished journey's series and figures along with the selection
+                st.session_state.update({
+                    'selected_patient_id': None,
+                    'current_week': 0,
+                    'adjustment_made': False,
+                    'current_glucose_data': None,
+                    'current_glucose_metrics': None,
+                    'journey_view': None,
+                    'journey_message': None
+                })
                 st.rerun()
         
         # Create the enhanced learning journey